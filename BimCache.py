@@ -0,0 +1,258 @@
+"""
+Скомпилированное здание
+
+Бинарный файл с плоскими массивами: координаты элементов, связи между ними,
+площади и триангуляции зон, ширины проемов. Файл читается через отображение в память,
+поэтому загрузка не требует ни разбора JSON, ни триангуляции, ни вычисления ширин проемов.
+
+Формат файла:
+    MAGIC (4 байта) | FORMAT_VERSION (uint32) | длина заголовка (uint32) | заголовок (JSON, utf8) | массивы
+
+Заголовок содержит описание здания (имена, уровни), хеш исходного файла и
+таблицу массивов (тип, размерность, смещение). Каждый массив выровнен на ALIGNMENT байт.
+"""
+
+from BimDataModel import BBuilding, BBuildElement, BLevel, BPoint, BSign, mapping_building
+from BimTools import Bim, Triangles
+from typing import Any, Dict, List, Tuple, Union
+from uuid import UUID
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+import numpy.typing as npt
+
+MAGIC = b"BIMC"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+CACHE_DIR = "__bimcache__"
+
+_PREAMBLE = struct.Struct("<4sII")
+
+
+def file_hash(path: str) -> str:
+    """sha256 содержимого файла"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class CompiledBimError(ValueError):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class CompiledBim:
+    """
+    Здание в виде плоских массивов
+
+    Элементы всех уровней пронумерованы подряд в порядке исходного файла.
+    Массивы `*_offset` -- границы (CSR) списков точек, выходов и треугольников элементов.
+    """
+
+    def __init__(self, header: Dict[str, Any], arrays: Dict[str, npt.NDArray[Any]]) -> None:
+        self.header = header
+        self.arrays = arrays
+
+    @property
+    def source_hash(self) -> str:
+        return self.header["source_hash"]
+
+    @property
+    def num_of_elements(self) -> int:
+        return len(self.arrays["sign"])
+
+    @staticmethod
+    def from_bim(building: BBuilding, bim: Bim, source_hash: str = "") -> "CompiledBim":
+        elements: List[Tuple[int, BBuildElement]] = [
+            (level_idx, e) for level_idx, level in enumerate(building.levels) for e in level.elements
+        ]
+
+        def offsets(sizes: List[int]) -> npt.NDArray[np.int64]:
+            return np.concatenate(([0], np.cumsum(sizes, dtype=np.int64))).astype(np.int64)
+
+        zone_tri: List[Triangles] = [
+            bim.zones[e.id]._tri if e.id in bim.zones else []  # pyright: ignore [reportPrivateUsage]
+            for _, e in elements
+        ]
+
+        arrays: Dict[str, npt.NDArray[Any]] = {
+            "id": np.frombuffer(b"".join(e.id.bytes for _, e in elements), dtype=np.uint8).reshape(-1, 16),
+            "sign": np.array([e.sign.value for _, e in elements], dtype=np.int8),
+            "level": np.array([level_idx for level_idx, _ in elements], dtype=np.int32),
+            "size_z": np.array([e.sizeZ for _, e in elements], dtype=np.float64),
+            "point_offset": offsets([len(e.points) for _, e in elements]),
+            "points": np.array([(p.x, p.y, p.z) for _, e in elements for p in e.points], dtype=np.float64).reshape(
+                -1, 3
+            ),
+            "output_offset": offsets([len(e.output) for _, e in elements]),
+            "output": np.frombuffer(b"".join(o.bytes for _, e in elements for o in e.output), dtype=np.uint8).reshape(
+                -1, 16
+            ),
+            "area": np.array([bim.zones[e.id].area if e.id in bim.zones else np.nan for _, e in elements]),
+            "tri_offset": offsets([len(tri) for tri in zone_tri]),
+            "triangles": np.array([[p for p in tr] for tri in zone_tri for tr in tri], dtype=np.float64).reshape(
+                -1, 3, 2
+            ),
+            "width": np.array([bim.transits[e.id].width if e.id in bim.transits else np.nan for _, e in elements]),
+        }
+
+        header: Dict[str, Any] = {
+            "source_hash": source_hash,
+            "name": building.name,
+            "addr": building.addr,
+            "levels": [{"name": level.name, "zlevel": level.zlevel} for level in building.levels],
+            "element_names": [e.name for _, e in elements],
+        }
+
+        return CompiledBim(header, arrays)
+
+    def write(self, path: str) -> None:
+        """Записать здание в файл. Запись атомарная: сначала во временный файл, затем переименование"""
+        table: Dict[str, Any] = {}
+        offset = 0
+        for name, arr in self.arrays.items():
+            table[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+            offset += -(-arr.nbytes // ALIGNMENT) * ALIGNMENT
+
+        header = json.dumps({**self.header, "arrays": table}, ensure_ascii=False).encode("utf8")
+        data_start = -(-(_PREAMBLE.size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            for name, arr in self.arrays.items():
+                f.seek(data_start + table[name]["offset"])
+                f.write(np.ascontiguousarray(arr).tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def read(path: str) -> "CompiledBim":
+        """Прочитать здание из файла. Массивы -- представления только для чтения поверх отображения файла в память"""
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(buffer) < _PREAMBLE.size:
+            raise CompiledBimError(f"File {path} is not a compiled building")
+        magic, version, header_len = _PREAMBLE.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise CompiledBimError(f"File {path} is not a compiled building")
+        if version != FORMAT_VERSION:
+            raise CompiledBimError(f"Compiled building format version {version} is not supported")
+
+        header: Dict[str, Any] = json.loads(bytes(buffer[_PREAMBLE.size : _PREAMBLE.size + header_len]))
+        data_start = -(-(_PREAMBLE.size + header_len) // ALIGNMENT) * ALIGNMENT
+
+        arrays: Dict[str, npt.NDArray[Any]] = {}
+        for name, desc in header.pop("arrays").items():
+            dtype = np.dtype(desc["dtype"])
+            shape = tuple(desc["shape"])
+            count = int(np.prod(shape))
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + desc["offset"]).reshape(
+                shape
+            )
+
+        return CompiledBim(header, arrays)
+
+    def to_building(self) -> BBuilding:
+        a = self.arrays
+        ids = _uuids(a["id"])
+        outputs = _uuids(a["output"])
+        points = [BPoint(x, y, z) for x, y, z in a["points"].tolist()]  # pyright: ignore [reportGeneralTypeIssues]
+        point_offset = a["point_offset"].tolist()
+        output_offset = a["output_offset"].tolist()
+        signs = [BSign(s) for s in a["sign"].tolist()]
+        size_z = a["size_z"].tolist()
+        names: List[str] = self.header["element_names"]
+
+        level_elements: List[List[BBuildElement]] = [[] for _ in self.header["levels"]]
+        for i, level_idx in enumerate(a["level"].tolist()):
+            level_elements[level_idx].append(
+                BBuildElement(
+                    id=ids[i],
+                    sign=signs[i],
+                    output=outputs[output_offset[i] : output_offset[i + 1]],
+                    points=points[point_offset[i] : point_offset[i + 1]],
+                    name=names[i],
+                    sizeZ=size_z[i],
+                )
+            )
+
+        levels = [
+            BLevel(name=level["name"], zlevel=level["zlevel"], elements=elements)
+            for level, elements in zip(self.header["levels"], level_elements)
+        ]
+        return BBuilding(levels=levels, name=self.header["name"], addr=self.header["addr"])
+
+    def to_bim(self) -> Bim:
+        """Построить `Bim` без триангуляции и вычисления ширин проемов"""
+        a = self.arrays
+        building = self.to_building()
+        ids = [e.id for level in building.levels for e in level.elements]
+
+        tri_offset = a["tri_offset"].tolist()
+        flat_tri = [(tuple(p0), tuple(p1), tuple(p2)) for p0, p1, p2 in a["triangles"].tolist()]
+        is_zone = ~np.isnan(a["area"])
+        is_transit = ~np.isnan(a["width"])
+
+        triangulations: Dict[UUID, Triangles] = {
+            ids[i]: flat_tri[tri_offset[i] : tri_offset[i + 1]]  # pyright: ignore [reportGeneralTypeIssues]
+            for i in np.flatnonzero(is_zone).tolist()
+        }
+        widths: Dict[UUID, float] = {
+            ids[i]: w for i, w in zip(np.flatnonzero(is_transit).tolist(), a["width"][is_transit].tolist())
+        }
+
+        return Bim(building, triangulations, widths)
+
+
+def _uuids(raw: npt.NDArray[np.uint8]) -> List[UUID]:
+    data = raw.tobytes()
+    return [UUID(bytes=data[i : i + 16]) for i in range(0, len(data), 16)]
+
+
+def compile_building(file_buildingjson: str, cache_path: str) -> CompiledBim:
+    """Разобрать JSON здания, построить `Bim` и сохранить скомпилированное здание в `cache_path`"""
+    source_hash = file_hash(file_buildingjson)
+    building = mapping_building(file_buildingjson)
+    compiled = CompiledBim.from_bim(building, Bim(building), source_hash)
+    compiled.write(cache_path)
+    return compiled
+
+
+def load_compiled(file_buildingjson: str, cache_dir: Union[str, None] = None) -> CompiledBim:
+    """
+    Скомпилированное здание для JSON файла
+
+    Кеш хранится в `cache_dir` (по умолчанию `__bimcache__` рядом с исходным файлом)
+    под именем, равным хешу содержимого исходного файла. Если файл изменился или кеш
+    записан другой версией формата, здание компилируется заново.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_buildingjson)), CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    source_hash = file_hash(file_buildingjson)
+    cache_path = os.path.join(cache_dir, f"{source_hash}.bimc")
+
+    if os.path.exists(cache_path):
+        try:
+            compiled = CompiledBim.read(cache_path)
+            if compiled.source_hash == source_hash:
+                return compiled
+        except CompiledBimError:
+            pass
+
+    return compile_building(file_buildingjson, cache_path)
+
+
+def load_bim(file_buildingjson: str, cache_dir: Union[str, None] = None) -> Bim:
+    """Аналог `Bim(mapping_building(file_buildingjson))`, использующий кеш скомпилированных зданий"""
+    return load_compiled(file_buildingjson, cache_dir).to_bim()
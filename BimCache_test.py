@@ -0,0 +1,45 @@
+import os
+import shutil
+import pytest
+import BimDataModel
+from BimCache import CompiledBim, CompiledBimError, load_bim, load_compiled
+from BimTools import Bim
+
+
+class TestBimCache:
+    @pytest.mark.parametrize(
+        "file", ["resources/two_levels.json", "resources/example-two-exits.json", "resources/udsu_block_3.json"]
+    )
+    def test_same_bim(self, file: str, tmp_path: str):
+        bim = Bim(BimDataModel.mapping_building(file))
+        cached = load_bim(file, str(tmp_path))
+
+        assert list(cached.zones) == list(bim.zones)
+        assert list(cached.transits) == list(bim.transits)
+        for zid, z in bim.zones.items():
+            assert cached.zones[zid].area == z.area
+            assert cached.zones[zid].points == z.points
+            assert cached.zones[zid].output == z.output
+        for tid, t in bim.transits.items():
+            assert cached.transits[tid].width == t.width
+            assert cached.transits[tid].sign == t.sign
+
+    def test_stale_cache_is_rebuilt(self, tmp_path: str):
+        file = os.path.join(tmp_path, "building.json")
+        cache_dir = os.path.join(tmp_path, "cache")
+
+        shutil.copyfile("resources/one_zone_one_exit.json", file)
+        first = load_compiled(file, cache_dir)
+
+        shutil.copyfile("resources/two_levels.json", file)
+        second = load_compiled(file, cache_dir)
+
+        assert first.source_hash != second.source_hash
+        assert second.num_of_elements == sum(
+            len(level.elements) for level in BimDataModel.mapping_building(file).levels
+        )
+        assert len(os.listdir(cache_dir)) == 2
+
+    def test_read_not_compiled_file(self):
+        with pytest.raises(CompiledBimError):
+            CompiledBim.read("resources/one_zone_one_exit.json")
@@ -1,9 +1,12 @@
 from BimDataModel import BSign
+from dataclasses import dataclass
 from BimTools import Bim, Transit, Zone
 from uuid import UUID
-from typing import Set, Tuple, Dict, List, Literal
+from typing import Set, Tuple, Dict, List, Literal, NamedTuple, Union
 
 import math
+import numpy as np
+import numpy.typing as npt
 
 
 PathTypeValues = Dict[Literal["V0", "A", "D0"], float]
@@ -19,9 +22,183 @@ class PeopleFlowVelocity(object):
         "STAIR_UP": {"V0": 60, "A": 0.305, "D0": 0.67},
     }
 
-    def __init__(self, projection_area: float = 0.1) -> None:
+    PATH_TYPES: List[ElementType] = ["ROOM", "TRANSIT", "STAIR_DOWN", "STAIR_UP"]
+
+    # Шаг сетки плотностей табличного режима, чел./м2
+    DENSITY_STEP = 1e-3
+
+    def __init__(
+        self, projection_area: float = 0.1, tabulated: bool = False, density_step: float = DENSITY_STEP
+    ) -> None:
+        """
+        Parameters
+        ----------
+        projection_area : float
+            площадь горизонтальной проекции человека, м2
+        tabulated : bool
+            табличный режим: скорости берутся линейной интерполяцией заранее вычисленных кривых
+            на равномерной сетке плотностей с шагом `density_step` вместо вычисления логарифма.
+            Кривые монотонно убывают, линейная интерполяция сохраняет монотонность.
+            Погрешность убывает как квадрат шага: при шаге 1e-3 чел./м2 максимальная абсолютная
+            погрешность не превышает 1.5e-5 м/мин (наибольшая -- для помещений вблизи D0),
+            при шаге 1e-2 -- 1.4e-3 м/мин. Фактическую погрешность возвращает `table_error`
+        density_step : float
+            шаг сетки плотностей табличного режима, чел./м2
+        """
         self.projection_area = projection_area
         self.D09 = self.to_pm2(0.9)
+        self.tabulated = tabulated
+        self.density_step = density_step
+
+        self._v0 = np.array([self.PATH_VALUE[p]["V0"] for p in self.PATH_TYPES], dtype=np.float64)
+        self._a = np.array([self.PATH_VALUE[p]["A"] for p in self.PATH_TYPES], dtype=np.float64)
+        self._d0 = np.array([self.PATH_VALUE[p]["D0"] for p in self.PATH_TYPES], dtype=np.float64)
+
+        if tabulated:
+            self._build_tables()
+
+    def _build_tables(self) -> None:
+        # Сетка покрывает плотности до D09: выше скорость в помещениях и на лестницах постоянна,
+        # а в проеме определяется пропускной способностью (D >= 0.9) и вычисляется без таблицы
+        self._grid_size = int(math.ceil(self.D09 / self.density_step)) + 1
+        grid = np.arange(self._grid_size + 1, dtype=np.float64) * self.density_step
+
+        tables = np.empty((len(self.PATH_TYPES), len(grid)), dtype=np.float64)
+        for code, path_type in enumerate(self.PATH_TYPES):
+            if path_type == "TRANSIT":
+                tables[code] = self._transit_speeds_exact(grid, None)
+            else:
+                tables[code] = self._element_speeds_exact(grid, np.full(len(grid), code))
+        self._tables = tables
+        self._tables_list: List[List[float]] = tables.tolist()
+
+    def path_codes(self, path_types: Union[npt.ArrayLike, List[ElementType]]) -> npt.NDArray[np.intp]:
+        """Номера видов пути в `PATH_TYPES`"""
+        codes = np.asarray(path_types)
+        if codes.dtype.kind in "UO":
+            lookup = {p: i for i, p in enumerate(self.PATH_TYPES)}
+            return np.array([lookup[p] for p in codes.ravel().tolist()], dtype=np.intp).reshape(codes.shape)
+        return codes.astype(np.intp)
+
+    def speeds(
+        self,
+        densities: npt.ArrayLike,
+        path_types: Union[npt.ArrayLike, List[ElementType]],
+        widths: Union[npt.ArrayLike, None] = None,
+    ) -> npt.NDArray[np.float64]:
+        """
+        Векторная функция скорости
+
+        Для элементов вида "ROOM", "STAIR_DOWN" и "STAIR_UP" совпадает с `speed_in_room` и `speed_on_stair`,
+        для "TRANSIT" -- со `speed_through_transit`.
+
+        Parameters
+        ----------
+        densities : array_like
+            плотность людского потока, чел./м2
+        path_types : array_like
+            вид пути: имена из `PATH_TYPES` или их номера
+        widths : array_like, optional
+            ширина проема, обязательна, если среди элементов есть проемы
+
+        Return
+        ------
+        Скорость, м/мин
+        """
+        d = np.asarray(densities, dtype=np.float64)
+        codes = np.broadcast_to(self.path_codes(path_types), d.shape)
+        is_transit = codes == self.PATH_TYPES.index("TRANSIT")
+
+        result = np.empty(d.shape, dtype=np.float64)
+        result[~is_transit] = self.element_speeds(d[~is_transit], codes[~is_transit])
+        if is_transit.any():
+            if widths is None:
+                raise ValueError("Widths are required to calculate speed through transits")
+            w = np.broadcast_to(np.asarray(widths, dtype=np.float64), d.shape)
+            result[is_transit] = self.transit_speeds(w[is_transit], d[is_transit])
+        return result
+
+    def element_speeds(self, d: npt.NDArray[np.float64], codes: npt.NDArray[np.intp]) -> npt.NDArray[np.float64]:
+        """Векторные `speed_in_room` и `speed_on_stair`, `codes` -- номера видов пути в `PATH_TYPES`"""
+        if self.tabulated:
+            return self._lookup(d, codes)
+        return self._element_speeds_exact(d, codes)
+
+    def transit_speeds(self, width: npt.NDArray[np.float64], d: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        """Векторная `speed_through_transit`"""
+        if self.tabulated:
+            v = self._lookup(d, np.full(d.shape, self.PATH_TYPES.index("TRANSIT"), dtype=np.intp))
+        else:
+            v = self._transit_speeds_exact(d, None)
+        return self._transit_capacity_limit(width, d, v)
+
+    def _element_speeds_exact(self, d: npt.NDArray[np.float64], codes: npt.NDArray[np.intp]) -> npt.NDArray[np.float64]:
+        v0, a, d0 = self._v0[codes], self._a[codes], self._d0[codes]
+        # При d <= d0 логарифм равен нулю и скорость равна v0
+        dd = np.minimum(d, self.D09)
+        return v0 * (1.0 - a * np.log(np.maximum(dd, d0) / d0))
+
+    def _transit_speeds_exact(
+        self, d: npt.NDArray[np.float64], width: Union[npt.NDArray[np.float64], None]
+    ) -> npt.NDArray[np.float64]:
+        # Скорость в проеме без ограничения пропускной способности (D >= 0.9), если ширина не задана
+        v0 = PeopleFlowVelocity.PATH_VALUE["TRANSIT"]["V0"]
+        d0 = PeopleFlowVelocity.PATH_VALUE["TRANSIT"]["D0"]
+        a = PeopleFlowVelocity.PATH_VALUE["TRANSIT"]["A"]
+
+        is_dense = d > d0
+        dd = np.maximum(d, d0)
+        D = dd * self.projection_area
+        m = np.where(D <= 0.5, 1.0, 1.25 - 0.5 * D)
+        q = v0 * (1.0 - a * np.log(dd / d0)) * D * m
+        v = np.where(is_dense, q / D, v0)
+        return v if width is None else self._transit_capacity_limit(width, d, v)
+
+    def _transit_capacity_limit(
+        self, width: npt.NDArray[np.float64], d: npt.NDArray[np.float64], v: npt.NDArray[np.float64]
+    ) -> npt.NDArray[np.float64]:
+        # При D >= 0.9 поток через проем определяется только его шириной
+        D = d * self.projection_area
+        is_limited = (d > PeopleFlowVelocity.PATH_VALUE["TRANSIT"]["D0"]) & (D >= 0.9)
+        if not is_limited.any():
+            return v
+        q = np.where(width < 1.6, 2.5 + 3.75 * width, 8.5)
+        return np.where(is_limited, q / np.where(is_limited, D, 1.0), v)
+
+    def _lookup(self, d: npt.NDArray[np.float64], codes: npt.NDArray[np.intp]) -> npt.NDArray[np.float64]:
+        x = np.clip(d, 0.0, self._grid_size * self.density_step) / self.density_step
+        i = np.minimum(x.astype(np.intp), self._grid_size - 1)
+        frac = x - i
+        left = self._tables[codes, i]
+        return left + (self._tables[codes, i + 1] - left) * frac
+
+    def _lookup_scalar(self, path_type: ElementType, d: float) -> float:
+        table = self._tables_list[self.PATH_TYPES.index(path_type)]
+        x = min(max(d, 0.0), self._grid_size * self.density_step) / self.density_step
+        i = min(int(x), self._grid_size - 1)
+        return table[i] + (table[i + 1] - table[i]) * (x - i)
+
+    def table_error(self, samples_per_step: int = 10) -> Dict[ElementType, float]:
+        """
+        Максимальная абсолютная погрешность табличного режима, м/мин
+
+        Табличные скорости сравниваются с аналитической формулой на сетке в `samples_per_step` раз мельче
+        табличной, на плотностях до 1.1 * D09. Для проемов проверяются ширины 1.0 и 2.0 м.
+        """
+        exact = PeopleFlowVelocity(self.projection_area)
+        tabulated = self if self.tabulated else PeopleFlowVelocity(self.projection_area, True, self.density_step)
+
+        d = np.linspace(0.0, 1.1 * self.D09, int(1.1 * self.D09 / self.density_step) * samples_per_step + 1)
+        errors: Dict[ElementType, float] = {}
+        for code, path_type in enumerate(self.PATH_TYPES):
+            codes = np.full(len(d), code)
+            if path_type == "TRANSIT":
+                errors[path_type] = max(
+                    float(np.max(np.abs(tabulated.speeds(d, codes, w) - exact.speeds(d, codes, w)))) for w in (1.0, 2.0)
+                )
+            else:
+                errors[path_type] = float(np.max(np.abs(tabulated.speeds(d, codes) - exact.speeds(d, codes))))
+        return errors
 
     def to_m2m2(self, d: float) -> float:
         return d * self.projection_area
@@ -73,6 +250,12 @@ class PeopleFlowVelocity(object):
         d0 = PeopleFlowVelocity.PATH_VALUE["TRANSIT"]["D0"]
         a = PeopleFlowVelocity.PATH_VALUE["TRANSIT"]["A"]
 
+        if self.tabulated and d > d0:
+            D = d * self.projection_area
+            if D >= 0.9:
+                return (2.5 + 3.75 * width if width < 1.6 else 8.5) / D
+            return self._lookup_scalar("TRANSIT", d)
+
         if d > d0:
             D = d * self.projection_area
 
@@ -101,6 +284,9 @@ class PeopleFlowVelocity(object):
         # то принудительно устанавливаем ее на уровке 0.9 м2/м2
         d = self.D09 if d >= self.D09 else d
 
+        if self.tabulated:
+            return self._lookup_scalar("ROOM", d)
+
         v0 = PeopleFlowVelocity.PATH_VALUE["ROOM"]["V0"]
         d0 = PeopleFlowVelocity.PATH_VALUE["ROOM"]["D0"]
         a = PeopleFlowVelocity.PATH_VALUE["ROOM"]["A"]
@@ -118,6 +304,9 @@ class PeopleFlowVelocity(object):
                                Индекс можети принимать значение `PeopleFlowVelocity.STAIR_DOWN` или `PeopleFlowVelocity.STAIR_UP`"
             )
 
+        if self.tabulated:
+            return self._lookup_scalar(direction, d)
+
         v0 = PeopleFlowVelocity.PATH_VALUE[direction]["V0"]
         d0 = PeopleFlowVelocity.PATH_VALUE[direction]["D0"]
         a = PeopleFlowVelocity.PATH_VALUE[direction]["A"]
@@ -125,6 +314,17 @@ class PeopleFlowVelocity(object):
         return PeopleFlowVelocity.velocity(v0, a, d0, d) if d > d0 else v0
 
 
+@dataclass(frozen=True)
+class EvacuationResult:
+    """Результат моделирования `Moving.run`"""
+
+    evacuation_time: float  # мин.
+    steps: int
+    num_of_people: float  # чел., осталось в здании
+    is_finished: bool  # False, если моделирование остановлено по `max_steps`
+    distribution: Dict[UUID, float]  # количество людей в зонах, включая безопасную зону
+
+
 class Moving(object):
     MODELLING_STEP = 0.008  # мин.
     MIN_DENSIY = 0.1  # чел./м2
@@ -134,46 +334,114 @@ class Moving(object):
         self.pfv = PeopleFlowVelocity(projection_area=0.1)
         self._step_counter = [0, 0, 0]
         self.direction_pairs: Dict[UUID, Tuple[Zone, Zone]] = {}
+        self._order: List[Tuple[Transit, Zone, Zone]] = []
+        self._order_bim: Union[Bim, None] = None
+        self._order_version = -1
+
+    def step(self, bim: Bim) -> float:
+        """
+        Шаг моделирования
 
-    def step(self, bim: Bim):
+        Return
+        ------
+        Количество людей, вышедших за шаг в безопасную зону
+        """
         self._step_counter[0] += 1
-        for t in bim.transits.values():
-            t.is_visited = False
-        for z in bim.zones.values():
-            z.is_visited = False
 
-        zones_to_process: Set[Zone] = set([bim.safety_zone])
-        self._step_counter[1] = 0
+        safety_zone = bim.safety_zone
+        evacuated = 0.0
+
+        transit: Transit
+        giving_zone: Zone
+        receiving_zone: Zone
+        for transit, giving_zone, receiving_zone in self._traversal_order(bim):
+            # giving_zone.potential = self.potential(receiving_zone, giving_zone, transit.width)
+            moved_people = self.part_of_people_flow(receiving_zone, giving_zone, transit)
+
+            receiving_zone.num_of_people += moved_people
+            giving_zone.num_of_people -= moved_people
+            transit.num_of_people = moved_people
+
+            if receiving_zone is safety_zone:
+                evacuated += moved_people
 
-        while len(zones_to_process) > 0:
-            receiving_zone = zones_to_process.pop()
-            self._step_counter[2] = 0
-            transit: Transit
-            for transit in (bim.transits[tid] for tid in receiving_zone.output):
-                if transit.is_visited or transit.is_blocked:
-                    continue
+        return evacuated
 
-                giving_zone: Zone = bim.zones[transit.output[0]]
-                if giving_zone.id == receiving_zone.id:
-                    giving_zone = bim.zones[transit.output[1]]
+    def run(self, bim: Bim, tolerance: float = 10e-3, max_steps: Union[int, None] = None) -> "EvacuationResult":
+        """
+        Моделирование до эвакуации всех людей из здания
+
+        Количество людей в здании считается по зонам, из которых есть путь в безопасную зону.
+        Оно вычисляется один раз перед моделированием и затем уменьшается на количество людей,
+        вышедших в безопасную зону за шаг, поэтому проверка окончания не требует обхода всех зон.
+        Вблизи `tolerance` количество пересчитывается точно, чтобы ошибка округления
+        не изменила момент окончания моделирования.
+
+        Parameters
+        ----------
+        bim -- здание
+        tolerance -- моделирование заканчивается, когда в здании осталось меньше `tolerance` человек
+        max_steps -- ограничение количества шагов моделирования
 
-                # giving_zone.potential = self.potential(receiving_zone, giving_zone, transit.width)
-                moved_people = self.part_of_people_flow(receiving_zone, giving_zone, transit)
+        Return
+        ------
+        Результат моделирования
+        """
+        remaining = self._remaining_people(bim)
+        # Допуск на накопленную ошибку округления инкрементного счетчика
+        margin = 1e-9 * max(1.0, remaining)
+
+        steps = 0
+        while remaining >= tolerance and (max_steps is None or steps < max_steps):
+            version = bim.topology_version
+            remaining -= self.step(bim)
+            steps += 1
+
+            if version != bim.topology_version or abs(remaining - tolerance) <= margin:
+                remaining = self._remaining_people(bim)
+
+        return EvacuationResult(
+            evacuation_time=steps * self.MODELLING_STEP,
+            steps=steps,
+            num_of_people=remaining,
+            is_finished=remaining < tolerance,
+            distribution={z.id: z.num_of_people for z in bim.zones.values()},
+        )
+
+    def _remaining_people(self, bim: Bim) -> float:
+        # Люди в зонах, из которых есть путь в безопасную зону
+        self._traversal_order(bim)
+        return sum([z.num_of_people for z in bim.zones.values() if z.is_visited and z is not bim.safety_zone])
+
+    def _traversal_order(self, bim: Bim) -> List[Tuple[Transit, Zone, Zone]]:
+        """
+        Порядок обхода графа, закешированный для текущей топологии здания
+
+        Обход пересчитывается только при смене здания или его `Bim.topology_version`.
+        При пересчете обновляются флаги `is_visited` и `direction_pairs`,
+        которые остаются неизменными, пока топология не поменяется.
+        """
+        if self._order_bim is bim and self._order_version == bim.topology_version:
+            return self._order
 
-                receiving_zone.num_of_people += moved_people
-                giving_zone.num_of_people -= moved_people
-                transit.num_of_people = moved_people
-                self.direction_pairs[transit.id] = (giving_zone, receiving_zone)
+        for t in bim.transits.values():
+            t.is_visited = False
+        for z in bim.zones.values():
+            z.is_visited = False
 
-                giving_zone.is_visited = True
-                transit.is_visited = True
+        self._order = traversal_order(bim)
+        self._order_bim = bim
+        self._order_version = bim.topology_version
 
-                if len(giving_zone.output) > 1:  # отсекаем помещения, в которых одна дверь
-                    zones_to_process.add(giving_zone)
+        self.direction_pairs = {}
+        for transit, giving_zone, receiving_zone in self._order:
+            self.direction_pairs[transit.id] = (giving_zone, receiving_zone)
+            giving_zone.is_visited = True
+            transit.is_visited = True
 
-                self._step_counter[2] += 1
+        self._step_counter[1] = len(self._order)
 
-            self._step_counter[1] += 1
+        return self._order
 
     def potential(self, rzone: Zone, gzone: Zone, twidth: float) -> float:
         p = math.sqrt(gzone.area) / self.speed_at_exit(rzone, gzone, twidth)
@@ -250,6 +518,344 @@ class Moving(object):
         return P * self.MODELLING_STEP
 
 
+def traversal_order(bim: Bim) -> List[Tuple[Transit, Zone, Zone]]:
+    """
+    Порядок обхода графа здания, который выполняет `Moving.step`
+
+    Обход повторяет `Moving.step` без перемещения людей, поэтому порядок пар
+    (проем, отдающая зона, принимающая зона) совпадает с порядком обработки в шаге моделирования.
+    Порядок зависит только от топологии здания (заблокированных проемов).
+
+    Return
+    ------
+    Список троек (transit, giving_zone, receiving_zone)
+    """
+    order: List[Tuple[Transit, Zone, Zone]] = []
+    zones = bim.zone_list
+    transits = bim.transit_list
+    zone_transits = bim.zone_transits
+    transit_zones = bim.transit_zones
+    visited = [False] * len(transits)
+
+    zones_to_process: Set[Zone] = set([bim.safety_zone])
+    while len(zones_to_process) > 0:
+        receiving_zone = zones_to_process.pop()
+        for ti in zone_transits(receiving_zone.index).tolist():
+            transit = transits[ti]
+            if visited[ti] or transit.is_blocked:
+                continue
+
+            linked = transit_zones(ti).tolist()
+            giving_zone: Zone = zones[linked[0]]
+            if giving_zone is receiving_zone:
+                giving_zone = zones[linked[1]]
+
+            order.append((transit, giving_zone, receiving_zone))
+            visited[ti] = True
+
+            if len(giving_zone.output) > 1:  # отсекаем помещения, в которых одна дверь
+                zones_to_process.add(giving_zone)
+
+    return order
+
+
+class _Wave(NamedTuple):
+    """Группа проемов, которые обрабатываются одновременно, и их параметры"""
+
+    transits: slice
+    g: npt.NDArray[np.intp]
+    r: npt.NDArray[np.intp]
+    width: npt.NDArray[np.float64]
+    path_codes: npt.NDArray[np.intp]
+    v0: npt.NDArray[np.float64]
+    a: npt.NDArray[np.float64]
+    d0: npt.NDArray[np.float64]
+    area_g: npt.NDArray[np.float64]
+    area_r: npt.NDArray[np.float64]
+    max_num_of_people_r: npt.NDArray[np.float64]
+
+
+class VectorMoving(object):
+    """
+    Модель движения людских потоков на массивах NumPy
+
+    Альтернатива `Moving.step`: площади зон, количество людей, ширины проемов
+    и коэффициенты вида пути упакованы в непрерывные массивы.
+    Проемы обрабатываются в том же порядке, что и в `Moving.step`, но сгруппированы в волны:
+    в одной волне каждая зона встречается не более одного раза, поэтому волна
+    вычисляется несколькими векторными операциями и дает тот же результат, что и последовательный обход.
+
+    Движок моделирует сразу несколько сценариев (например, разные начальные плотности) на одной геометрии.
+    Состояние хранится в двумерных массивах: строка -- сценарий, столбец -- зона в порядке `zones`.
+    Каждый сценарий останавливается сам, когда из здания эвакуировались все люди.
+
+    Состояние хранится в движке, в объекты `Zone` и `Transit` оно записывается методом `store`.
+    """
+
+    MODELLING_STEP = Moving.MODELLING_STEP  # мин.
+    MIN_DENSIY = Moving.MIN_DENSIY  # чел./м2
+    MAX_DENSIY = Moving.MAX_DENSIY  # чел./м2
+
+    def __init__(
+        self,
+        bim: Bim,
+        num_of_people: Union[npt.ArrayLike, None] = None,
+        pfv: Union[PeopleFlowVelocity, None] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        bim : Bim
+            здание
+        num_of_people : array_like, optional
+            количество людей в зонах, матрица сценарии x зоны (порядок зон -- `bim.zones`).
+            По умолчанию моделируется один сценарий с текущим количеством людей в зонах здания
+        pfv : PeopleFlowVelocity, optional
+            функции скорости, например в табличном режиме. По умолчанию -- аналитические
+        """
+        self.pfv = pfv if pfv is not None else PeopleFlowVelocity(projection_area=0.1)
+        self.bim = bim
+        self._step_counter = 0
+
+        self.zones: List[Zone] = bim.zone_list
+
+        self.area = np.array([z.area for z in self.zones], dtype=np.float64)
+        self.max_num_of_people = self.MAX_DENSIY * self.area
+
+        if num_of_people is None:
+            self.num_of_people = np.array([[z.num_of_people for z in self.zones]], dtype=np.float64)
+            # Плотность хранится отдельно: после `Zone.density = value` она не пересчитывается из количества людей
+            self.density = np.array([[z.density for z in self.zones]], dtype=np.float64)
+        else:
+            self.num_of_people = np.array(num_of_people, dtype=np.float64, ndmin=2)
+            if self.num_of_people.shape[1] != len(self.zones):
+                raise ValueError(
+                    f"Number of people is given for {self.num_of_people.shape[1]} zones, bim has {len(self.zones)}"
+                )
+            self.density = self.num_of_people / self.area
+
+        num_of_scenarios = self.num_of_people.shape[0]
+        self.steps = np.zeros(num_of_scenarios, dtype=np.int64)
+        self.flow = np.zeros((num_of_scenarios, 0), dtype=np.float64)
+        # Сценарии, которые еще моделируются
+        self._active = np.arange(num_of_scenarios, dtype=np.intp)
+
+        self._compile()
+
+    @classmethod
+    def from_densities(cls, bim: Bim, densities: npt.ArrayLike) -> "VectorMoving":
+        """
+        Сценарии с одинаковой плотностью во всех зонах, кроме безопасной (аналог `Bim.set_density`)
+
+        Parameters
+        ----------
+        densities : array_like
+            начальные плотности сценариев, чел./м2
+        """
+        d = np.asarray(densities, dtype=np.float64).reshape(-1, 1)
+        zones = bim.zone_list
+        is_safety_zone = np.arange(len(zones)) == bim.safety_zone.index
+        area = np.array([z.area for z in zones], dtype=np.float64)
+
+        num_of_people = np.where(is_safety_zone, bim.safety_zone.num_of_people, d * area)
+        vm = cls(bim, num_of_people)
+        vm.density = np.where(is_safety_zone, bim.safety_zone.density, np.broadcast_to(d, num_of_people.shape))
+        return vm
+
+    def _compile(self) -> None:
+        """Упаковать порядок обхода и параметры проемов для текущей топологии здания"""
+        order = traversal_order(self.bim)
+        self._topology_version = self.bim.topology_version
+
+        # Номер волны проема: на единицу больше последней волны, в которой участвовала любая из его зон
+        zone_wave = [0] * len(self.zones)
+        waves: List[int] = []
+        for _, gzone, rzone in order:
+            g, r = gzone.index, rzone.index
+            wave = max(zone_wave[g], zone_wave[r]) + 1
+            zone_wave[g] = zone_wave[r] = wave
+            waves.append(wave)
+
+        # Внутри волны сохраняется порядок обхода
+        sorted_order = sorted(range(len(order)), key=lambda k: (waves[k], k))
+        self.transits: List[Transit] = [order[k][0] for k in sorted_order]
+        self.giving = np.array([order[k][1].index for k in sorted_order], dtype=np.intp)
+        self.receiving = np.array([order[k][2].index for k in sorted_order], dtype=np.intp)
+        self.width = np.array([t.width for t in self.transits], dtype=np.float64)
+        self.flow = np.zeros((self.num_of_people.shape[0], len(self.transits)), dtype=np.float64)
+
+        self.path_codes = self.pfv.path_codes([self._path_type(order[k][2], order[k][1]) for k in sorted_order])
+        self.v0 = self.pfv._v0[self.path_codes]  # pyright: ignore [reportPrivateUsage]
+        self.a = self.pfv._a[self.path_codes]  # pyright: ignore [reportPrivateUsage]
+        self.d0 = self.pfv._d0[self.path_codes]  # pyright: ignore [reportPrivateUsage]
+
+        bounds = np.flatnonzero(np.diff(np.array([waves[k] for k in sorted_order], dtype=np.intp))) + 1
+        self._waves: List[_Wave] = []
+        for start, stop in zip([0, *bounds.tolist()], [*bounds.tolist(), len(order)]):
+            w = slice(start, stop)
+            g, r = self.giving[w], self.receiving[w]
+            self._waves.append(
+                _Wave(
+                    w, g, r, self.width[w], self.path_codes[w], self.v0[w], self.a[w], self.d0[w],
+                    self.area[g], self.area[r], self.max_num_of_people[r],
+                )
+            )  # fmt: skip
+
+        # Зоны, из которых выходят люди. Безопасная зона в их число не входит
+        self._giving_zones = np.unique(self.giving)
+
+    @staticmethod
+    def _path_type(rzone: Zone, gzone: Zone) -> ElementType:
+        # Повторяет выбор скорости в `Moving.speed_in_element`
+        dh = rzone.points[0].z - gzone.points[0].z
+        if abs(dh) > 1e-3 and rzone.sign == BSign.Staircase:
+            return "STAIR_DOWN" if dh > 0 else "STAIR_UP"
+        return "ROOM"
+
+    @property
+    def num_of_scenarios(self) -> int:
+        return self.num_of_people.shape[0]
+
+    @property
+    def remaining(self) -> npt.NDArray[np.float64]:
+        """Количество людей в здании по сценариям"""
+        return self.num_of_people[:, self._giving_zones].sum(axis=1)
+
+    @property
+    def people_in_building(self) -> float:
+        """Количество людей в здании, суммарно по всем сценариям"""
+        return float(self.remaining.sum())
+
+    @property
+    def evacuation_time(self) -> npt.NDArray[np.float64]:
+        """Длительность эвакуации по сценариям, мин."""
+        return self.steps * self.MODELLING_STEP
+
+    @property
+    def is_finished(self) -> bool:
+        return len(self._active) == 0
+
+    def step(self) -> None:
+        """Шаг моделирования для всех сценариев"""
+        if self._topology_version != self.bim.topology_version:
+            self._compile()
+
+        self._step_counter += 1
+        self._step(self.num_of_people, self.density, self.flow)
+        self.steps += 1
+
+    def run(self, tolerance: float = 10e-3, max_steps: Union[int, None] = None) -> npt.NDArray[np.float64]:
+        """
+        Моделирование до эвакуации всех сценариев
+
+        Сценарий считается завершенным, когда в здании осталось меньше `tolerance` человек.
+        Завершенные сценарии исключаются из расчета, их состояние больше не меняется.
+
+        Return
+        ------
+        Длительность эвакуации по сценариям, мин.
+        """
+        self._drop_finished(tolerance)
+        while not self.is_finished and (max_steps is None or self._step_counter < max_steps):
+            if self._topology_version != self.bim.topology_version:
+                self._compile()
+            self._step_counter += 1
+
+            active = self._active
+            if len(active) == self.num_of_scenarios:
+                self._step(self.num_of_people, self.density, self.flow)
+            else:
+                num_of_people, density, flow = self.num_of_people[active], self.density[active], self.flow[active]
+                self._step(num_of_people, density, flow)
+                self.num_of_people[active], self.density[active], self.flow[active] = num_of_people, density, flow
+
+            self.steps[active] += 1
+            self._drop_finished(tolerance)
+
+        return self.evacuation_time
+
+    def _drop_finished(self, tolerance: float) -> None:
+        active = self._active
+        self._active = active[self.num_of_people[active][:, self._giving_zones].sum(axis=1) >= tolerance]
+
+    def _step(
+        self, num_of_people: npt.NDArray[np.float64], density: npt.NDArray[np.float64], flow: npt.NDArray[np.float64]
+    ) -> None:
+        for wave in self._waves:
+            moved = self._part_of_people_flow(num_of_people, density, wave)
+
+            rnop = num_of_people[:, wave.r] + moved
+            num_of_people[:, wave.r] = rnop
+            density[:, wave.r] = rnop / wave.area_r
+
+            gnop = num_of_people[:, wave.g] - moved
+            if (gnop < 0).any():
+                raise ValueError("Number of people in zone below 0 is not possible")
+            num_of_people[:, wave.g] = gnop
+            density[:, wave.g] = gnop / wave.area_g
+
+            flow[:, wave.transits] = moved
+
+    def _part_of_people_flow(
+        self, num_of_people: npt.NDArray[np.float64], density: npt.NDArray[np.float64], wave: "_Wave"
+    ) -> npt.NDArray[np.float64]:
+        # Векторная версия `Moving.part_of_people_flow`
+        gdensity = density[:, wave.g]
+        is_sparse = gdensity <= self.MIN_DENSIY
+        door_width = np.where(is_sparse, wave.area_g, wave.width)
+
+        speed = np.minimum(self._speed_in_element(gdensity, wave), self._speed_through_transit(door_width, gdensity))
+        part_of_people_flow = gdensity * speed * door_width * self.MODELLING_STEP
+        part_of_people_flow = np.where(is_sparse, num_of_people[:, wave.g], part_of_people_flow)
+
+        capacity_reciving_zone = wave.max_num_of_people_r - num_of_people[:, wave.r]
+        return np.where(
+            capacity_reciving_zone < 0,
+            0.0,
+            np.minimum(capacity_reciving_zone, part_of_people_flow),
+        )
+
+    def _speed_in_element(self, density: npt.NDArray[np.float64], wave: "_Wave") -> npt.NDArray[np.float64]:
+        # `PeopleFlowVelocity.speed_in_room` и `PeopleFlowVelocity.speed_on_stair`
+        if self.pfv.tabulated:
+            return self.pfv.element_speeds(density, wave.path_codes)
+
+        # При d <= d0 логарифм равен нулю и скорость равна v0
+        d = np.minimum(density, self.pfv.D09)
+        return wave.v0 * (1.0 - wave.a * np.log(np.maximum(d, wave.d0) / wave.d0))
+
+    def _speed_through_transit(
+        self, width: npt.NDArray[np.float64], d: npt.NDArray[np.float64]
+    ) -> npt.NDArray[np.float64]:
+        # `PeopleFlowVelocity.speed_through_transit`
+        if self.pfv.tabulated:
+            return self.pfv.transit_speeds(width, d)
+
+        v0 = PeopleFlowVelocity.PATH_VALUE["TRANSIT"]["V0"]
+        d0 = PeopleFlowVelocity.PATH_VALUE["TRANSIT"]["D0"]
+        a = PeopleFlowVelocity.PATH_VALUE["TRANSIT"]["A"]
+
+        is_dense = d > d0
+        if not is_dense.any():
+            return np.full_like(d, v0)
+
+        dd = np.maximum(d, d0)
+        D = dd * self.pfv.projection_area
+        m = np.where(D <= 0.5, 1.0, 1.25 - 0.5 * D)
+        q = v0 * (1.0 - a * np.log(dd / d0)) * D * m
+        q = np.where(D >= 0.9, np.where(width < 1.6, 2.5 + 3.75 * width, 8.5), q)
+
+        return np.where(is_dense, q / D, v0)
+
+    def store(self, scenario: int = 0) -> None:
+        """Записать состояние сценария в зоны и проемы здания"""
+        for z, n, d in zip(self.zones, self.num_of_people[scenario].tolist(), self.density[scenario].tolist()):
+            z.num_of_people = n
+            z._density = d  # pyright: ignore [reportPrivateUsage]
+        for t, f in zip(self.transits, self.flow[scenario].tolist()):
+            t.num_of_people = f
+
+
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
 
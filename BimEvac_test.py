@@ -0,0 +1,168 @@
+import pytest
+import BimDataModel
+from BimTools import Bim
+from BimComplexity import BimComplexity
+from BimEvac import Moving, PeopleFlowVelocity, VectorMoving
+
+RESOURCES = [
+    "resources/building_example.json",
+    "resources/example-one-exit.json",
+    "resources/example-two-exits.json",
+    "resources/one_zone_one_exit.json",
+    "resources/three_zones_three_transits.json",
+    "resources/two_levels.json",
+]
+
+
+def _prepare_bim(file: str, density: float) -> Bim:
+    bim = Bim(BimDataModel.mapping_building(file))
+    BimComplexity(bim)  # check a building
+
+    for t in bim.transits.values():
+        t.width = 2.0
+
+    bim.set_density(Moving().pfv.to_pm2(density))
+    return bim
+
+
+def _moving_steps(bim: Bim) -> int:
+    wo_safety = list(filter(lambda x: not (x.id == bim.safety_zone.id), bim.zones.values()))
+
+    m = Moving()
+    steps = 0
+    nop = sum([x.num_of_people for x in wo_safety if x.is_visited])
+    while nop >= 10e-3:
+        m.step(bim)
+        steps += 1
+        nop = sum([x.num_of_people for x in wo_safety if x.is_visited])
+
+    return steps
+
+
+class TestBimEvacPeopleFlowVelocity:
+    DENSITIES = [0.0, 0.3, 0.51, 0.65, 1.0, 2.5, 4.99, 5.0, 5.01, 7.3, 8.99, 9.0, 9.5, 12.0]
+
+    @pytest.mark.parametrize("tabulated", [False, True])
+    def test_speeds_match_scalar_functions(self, tabulated: bool):
+        pfv = PeopleFlowVelocity(tabulated=tabulated)
+        for width in [1.0, 2.0]:
+            expected = [
+                *[pfv.speed_in_room(d) for d in self.DENSITIES],
+                *[pfv.speed_through_transit(width, d) for d in self.DENSITIES],
+                *[pfv.speed_on_stair("STAIR_DOWN", d) for d in self.DENSITIES],
+                *[pfv.speed_on_stair("STAIR_UP", d) for d in self.DENSITIES],
+            ]
+            path_types = [p for p in PeopleFlowVelocity.PATH_TYPES for _ in self.DENSITIES]
+
+            speeds = pfv.speeds(self.DENSITIES * 4, path_types, width)
+
+            assert speeds.tolist() == pytest.approx(expected, rel=1e-12)
+
+    def test_table_error(self):
+        errors = PeopleFlowVelocity(tabulated=True).table_error()
+
+        assert max(errors.values()) < 1.5e-5
+
+    def test_tabulated_evacuation_time(self):
+        bim = _prepare_bim("resources/two_levels.json", 0.9)
+        exact = VectorMoving(bim).run()
+        tabulated = VectorMoving(bim, pfv=PeopleFlowVelocity(tabulated=True)).run()
+
+        assert tabulated == pytest.approx(exact, abs=Moving.MODELLING_STEP)
+
+
+class TestBimEvacVectorMoving:
+    @pytest.mark.parametrize("file", RESOURCES)
+    @pytest.mark.parametrize("density", [0.1, 0.5, 0.9])
+    def test_same_evacuation_time_as_moving(self, file: str, density: float):
+        vm = VectorMoving(_prepare_bim(file, density))
+        steps = 0
+        while vm.people_in_building >= 10e-3:
+            vm.step()
+            steps += 1
+
+        assert steps == _moving_steps(_prepare_bim(file, density))
+
+    @pytest.mark.parametrize("file", RESOURCES)
+    def test_density_sweep(self, file: str):
+        densities = [0.1, 0.5, 0.9]
+        bim = _prepare_bim(file, densities[0])
+        vm = VectorMoving.from_densities(bim, [Moving().pfv.to_pm2(d) for d in densities])
+        vm.run()
+
+        assert vm.steps.tolist() == [_moving_steps(_prepare_bim(file, d)) for d in densities]
+
+    def test_population_matrix(self):
+        bim = _prepare_bim("resources/three_zones_three_transits.json", 0.5)
+        vm = VectorMoving(bim)
+        single = vm.run()
+
+        batch = VectorMoving(bim, [[z.num_of_people for z in bim.zones.values()]] * 3)
+        batch.run()
+
+        assert batch.evacuation_time.tolist() == [single[0]] * 3
+
+    def test_store(self):
+        bim = _prepare_bim("resources/two_levels.json", 0.5)
+        vm = VectorMoving(bim)
+        for _ in range(100):
+            vm.step()
+        vm.store()
+
+        m_bim = _prepare_bim("resources/two_levels.json", 0.5)
+        m = Moving()
+        for _ in range(100):
+            m.step(m_bim)
+
+        for zid, z in bim.zones.items():
+            assert z.num_of_people == pytest.approx(m_bim.zones[zid].num_of_people, rel=1e-12, abs=1e-12)
+        for tid, t in bim.transits.items():
+            assert t.num_of_people == pytest.approx(m_bim.transits[tid].num_of_people, rel=1e-12, abs=1e-12)
+
+
+class TestBimEvacMoving:
+    def test_traversal_order_is_cached(self):
+        bim = _prepare_bim("resources/two_levels.json", 0.5)
+        m = Moving()
+        m.step(bim)
+        order = m._traversal_order(bim)  # pyright: ignore [reportPrivateUsage]
+        m.step(bim)
+
+        assert m._traversal_order(bim) is order  # pyright: ignore [reportPrivateUsage]
+
+    def test_traversal_order_invalidated_by_blocking(self):
+        bim = _prepare_bim("resources/example-two-exits.json", 0.5)
+        m = Moving()
+        m.step(bim)
+        exit_transit = bim.transits[bim.safety_zone.output[0]]
+        assert exit_transit.id in m.direction_pairs
+
+        version = bim.topology_version
+        exit_transit.is_blocked = True
+        assert bim.topology_version > version
+
+        m.step(bim)
+        assert exit_transit.id not in m.direction_pairs
+        assert not exit_transit.is_visited
+
+    @pytest.mark.parametrize("file", RESOURCES)
+    @pytest.mark.parametrize("density", [0.1, 0.5, 0.9])
+    def test_run_same_steps_as_loop(self, file: str, density: float):
+        bim = _prepare_bim(file, density)
+        result = Moving().run(bim)
+
+        assert result.is_finished
+        assert result.steps == _moving_steps(_prepare_bim(file, density))
+        assert result.evacuation_time == result.steps * Moving.MODELLING_STEP
+
+        wo_safety = [z for z in bim.zones.values() if z is not bim.safety_zone and z.is_visited]
+        assert result.num_of_people == pytest.approx(sum(z.num_of_people for z in wo_safety), abs=1e-9)
+        assert result.distribution == {z.id: z.num_of_people for z in bim.zones.values()}
+
+    def test_run_max_steps(self):
+        bim = _prepare_bim("resources/two_levels.json", 0.5)
+        result = Moving().run(bim, max_steps=10)
+
+        assert result.steps == 10
+        assert not result.is_finished
+        assert result.num_of_people > 0
@@ -0,0 +1,154 @@
+"""
+Векторные геометрические ядра для построения здания
+
+Полигоны и триангуляции упаковываются в плоские массивы координат с границами (CSR),
+и все вычисления выполняются для всех элементов сразу.
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+Point2D = Tuple[float, float]
+Triangle = Tuple[Point2D, Point2D, Point2D]
+
+
+def pack_polygons(polygons: Sequence[Sequence[Point2D]]) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.int64]]:
+    """
+    Упаковать полигоны в массив координат
+
+    Return
+    ------
+    coords -- массив (N, 2) вершин всех полигонов подряд,
+    offsets -- массив (P + 1,) границ полигонов в `coords`
+    """
+    sizes = [len(polygon) for polygon in polygons]
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    coords = np.array([p for polygon in polygons for p in polygon], dtype=np.float64).reshape(-1, 2)
+    return coords, offsets
+
+
+def pack_triangulations(
+    triangulations: Sequence[Sequence[Triangle]],
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.int64]]:
+    """
+    Упаковать триангуляции в массив треугольников
+
+    Return
+    ------
+    triangles -- массив (T, 3, 2) треугольников всех полигонов подряд,
+    offsets -- массив (P + 1,) границ триангуляций в `triangles`
+    """
+    sizes = [len(tri) for tri in triangulations]
+    offsets = np.zeros(len(triangulations) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    triangles = np.array([tr for tri in triangulations for tr in tri], dtype=np.float64).reshape(-1, 3, 2)
+    return triangles, offsets
+
+
+def _segment_sums(values: npt.NDArray[np.float64], offsets: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+    """
+    Суммы сегментов массива с последовательным накоплением слева направо
+
+    В отличие от `np.add.reduceat`, который для длинных сегментов использует попарное суммирование,
+    порядок сложения совпадает со встроенной функцией `sum`, поэтому результат совпадает до бита.
+    """
+    counts = np.diff(offsets)
+    sums = np.zeros(len(counts), dtype=np.float64)
+    if len(values) == 0:
+        return sums
+
+    for j in range(int(counts.max())):
+        has_item = counts > j
+        sums[has_item] += values[offsets[:-1][has_item] + j]
+    return sums
+
+
+def shoelace_areas(coords: npt.NDArray[np.float64], offsets: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+    """
+    Площади полигонов по формуле шнурков (Гаусса)
+
+    Вершины полигона задаются без замыкающей точки. Результат совпадает с суммой площадей треугольников
+    триангуляции с точностью до ошибки округления (несколько ULP), но не требует триангуляции.
+    """
+    if len(coords) == 0:
+        return np.zeros(len(offsets) - 1, dtype=np.float64)
+
+    non_empty = np.diff(offsets) > 0
+    starts = offsets[:-1]
+
+    # Следующая вершина в пределах своего полигона
+    nxt = np.arange(1, len(coords) + 1, dtype=np.int64)
+    nxt[offsets[1:][non_empty] - 1] = starts[non_empty]
+
+    x, y = coords[:, 0], coords[:, 1]
+    cross = x * y[nxt] - x[nxt] * y
+    areas = np.abs(0.5 * np.add.reduceat(cross, np.minimum(starts, len(coords) - 1)))
+    return np.where(non_empty, areas, 0.0)
+
+
+def triangulation_areas(triangles: npt.NDArray[np.float64], offsets: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+    """
+    Площади полигонов как суммы площадей треугольников их триангуляций
+
+    Повторяет вычисление `Zone._calculate_area` (без округления) поэлементно, поэтому результат совпадает до бита.
+    """
+    p1, p2, p3 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    tri_areas = np.abs(
+        0.5 * ((p2[:, 0] - p1[:, 0]) * (p3[:, 1] - p1[:, 1]) - (p3[:, 0] - p1[:, 0]) * (p2[:, 1] - p1[:, 1]))
+    )
+    return _segment_sums(tri_areas, offsets)
+
+
+def points_in_triangulations(
+    points: npt.NDArray[np.float64],
+    owners: npt.NDArray[np.int64],
+    triangles: npt.NDArray[np.float64],
+    offsets: npt.NDArray[np.int64],
+) -> npt.NDArray[np.bool_]:
+    """
+    Пакетная проверка вхождения точек в полигоны
+
+    Точка `points[k]` проверяется на вхождение в полигон `owners[k]`, заданный триангуляцией.
+    Точка на границе треугольника считается лежащей внутри, как в `Transit._point_in_polygon`.
+    """
+    counts = np.diff(offsets)[owners]
+    pair_point = np.repeat(np.arange(len(points)), counts)
+    # Номер треугольника для каждой пары (точка, треугольник полигона-владельца)
+    starts = np.repeat(offsets[:-1][owners], counts)
+    pair_tri = starts + (np.arange(len(pair_point)) - np.repeat(np.cumsum(counts) - counts, counts))
+
+    p = points[pair_point]
+    tr = triangles[pair_tri]
+
+    def where_point(a: npt.NDArray[np.float64], b: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        return (b[:, 0] - a[:, 0]) * (p[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (p[:, 0] - a[:, 0])
+
+    inside_tri = (
+        (where_point(tr[:, 0], tr[:, 1]) >= 0)
+        & (where_point(tr[:, 1], tr[:, 2]) >= 0)
+        & (where_point(tr[:, 2], tr[:, 0]) >= 0)
+    )
+
+    inside = np.zeros(len(points), dtype=np.bool_)
+    np.logical_or.at(inside, pair_point[inside_tri], True)
+    return inside
+
+
+def bounding_boxes(
+    coords: npt.NDArray[np.float64], offsets: npt.NDArray[np.int64]
+) -> List[Tuple[float, float, float, float]]:
+    """Описывающие прямоугольники полигонов (min_x, min_y, max_x, max_y)"""
+    result: List[Tuple[float, float, float, float]] = []
+    starts = offsets[:-1]
+    non_empty = np.diff(offsets) > 0
+    if len(coords) == 0:
+        return [(0.0, 0.0, 0.0, 0.0)] * len(starts)
+
+    mins = np.minimum.reduceat(coords, np.minimum(starts, len(coords) - 1), axis=0)
+    maxs = np.maximum.reduceat(coords, np.minimum(starts, len(coords) - 1), axis=0)
+    for has_points, mn, mx in zip(non_empty.tolist(), mins.tolist(), maxs.tolist()):
+        result.append((mn[0], mn[1], mx[0], mx[1]) if has_points else (0.0, 0.0, 0.0, 0.0))
+    return result
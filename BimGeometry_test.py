@@ -0,0 +1,54 @@
+import pytest
+import tripy
+import numpy as np
+import BimGeometry
+from BimDataModel import mapping_building
+from BimTools import Bim, Transit
+from typing import List, Tuple
+
+SQUARE = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0)]
+PARALLELOGRAM = [(-2.0, -1.0), (2.0, -1.0), (3.0, 1.0), (-1.0, 1.0)]
+TRIANGLE = [(0.0, -1.0), (1.0, 0.0), (0.0, 1.0)]
+
+
+class TestBimGeometryAreas:
+    def test_shoelace_areas(self):
+        coords, offsets = BimGeometry.pack_polygons([SQUARE, [], PARALLELOGRAM, TRIANGLE])
+
+        assert BimGeometry.shoelace_areas(coords, offsets).tolist() == [1.0, 0.0, 8.0, 1.0]
+
+    def test_triangulation_areas_match_zone_areas(self):
+        bim = Bim(mapping_building("resources/udsu_block_3.json"))
+        zones = [z for z in bim.zones.values() if z.id != bim.safety_zone.id]
+
+        tris = [tripy.earclip([(p.x, p.y) for p in z.points[:-1]]) for z in zones]
+        areas = BimGeometry.triangulation_areas(*BimGeometry.pack_triangulations(tris))
+
+        assert [round(a, 15) for a in areas.tolist()] == [z.area for z in zones]
+
+    def test_shoelace_close_to_triangulation(self):
+        bim = Bim(mapping_building("resources/udsu_block_3.json"))
+        zones = [z for z in bim.zones.values() if z.id != bim.safety_zone.id]
+
+        coords, offsets = BimGeometry.pack_polygons([[(p.x, p.y) for p in z.points[:-1]] for z in zones])
+
+        assert BimGeometry.shoelace_areas(coords, offsets) == pytest.approx([z.area for z in zones], rel=1e-12)
+
+
+class TestBimGeometryPointInPolygon:
+    def test_points_in_triangulations(self):
+        polygons = [SQUARE, PARALLELOGRAM]
+        points: List[Tuple[float, float]] = [(0.5, 0.5), (1.0, 1.0), (1.5, 0.5), (0.0, 0.0), (2.5, 0.5), (-1.9, 0.9)]
+        owners = [0, 0, 0, 1, 1, 1]
+
+        tris = [tripy.earclip(polygon) for polygon in polygons]
+        inside = BimGeometry.points_in_triangulations(
+            np.array(points), np.array(owners), *BimGeometry.pack_triangulations(tris)
+        )
+
+        transit = Transit.__new__(Transit)
+        expected = [
+            transit._point_in_polygon(p, tris[o])
+            for p, o in zip(points, owners)  # pyright: ignore [reportPrivateUsage]
+        ]
+        assert inside.tolist() == expected == [True, True, False, True, True, False]
@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 
-from typing import Union, Tuple, List, Dict
+from typing import Union, Tuple, List, Dict, NamedTuple
 from uuid import UUID
 import tripy
 import math
+import numpy as np
+import numpy.typing as npt
+import BimGeometry
 from BimDataModel import BBuilding, BBuildElement, BPoint, BSign, mapping_building
 
 Point2D = Tuple[float, float]
@@ -14,38 +17,77 @@ NDIGITS: int = 15
 
 
 class Bim:
-    def __init__(self, bim: BBuilding) -> None:
+    def __init__(
+        self,
+        bim: BBuilding,
+        triangulations: Union[Dict[UUID, Triangles], None] = None,
+        widths: Union[Dict[UUID, float], None] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        bim : BBuilding
+            здание
+        triangulations : Dict[UUID, Triangles], optional
+            готовые триангуляции зон, например из скомпилированного здания (см. `BimCache`)
+        widths : Dict[UUID, float], optional
+            готовые ширины проемов. Для проемов из словаря ширина не вычисляется
+        """
         self.zones: Dict[UUID, Zone] = {}
         self.transits: Dict[UUID, Transit] = {}
 
         self._area = 0.0
         self._num_of_people = 0.0
         self._sz_output: List[UUID] = []
+        self._topology_version = TopologyVersion()
+        self.geometry = GeometryCache()
+
+        self.geometry.prepare(
+            [e for level in bim.levels for e in level.elements if e.sign == BSign.Room or e.sign == BSign.Staircase],
+            triangulations,
+        )
 
         for level in bim.levels:
             for e in level.elements:
                 element: Union[Zone, Transit]
                 if e.sign == BSign.Room or e.sign == BSign.Staircase:
-                    element = Zone(e)
+                    element = Zone(e, triangulations.get(e.id) if triangulations is not None else None, self.geometry)
                     self._area += element.area
                     self._num_of_people += element.num_of_people
                     self.zones[e.id] = element
                 elif e.sign == BSign.DoorWay or e.sign == BSign.DoorWayInt or e.sign == BSign.DoorWayOut:
                     element = Transit(e)
+                    element.topology_version = self._topology_version
                     self.transits[e.id] = element
                     if len(element.output) == 1:
                         self._sz_output.append(e.id)
 
-        incorrect_transits: List[Tuple[Transit, Zone]] = []
+        to_calculate: List[Transit] = []
         for t in self.transits.values():
+            if widths is not None and t.id in widths:
+                t._width = widths[t.id]  # pyright: ignore [reportPrivateUsage]
+                continue
+
             z_linked: Zone = self.zones[t.output[0]]
             if t.sign == BSign.DoorWay and z_linked.sign == BSign.Staircase:
                 z2_linked = self.zones[t.output[1]]
                 if z2_linked.sign == BSign.Staircase:
                     t.width = (math.sqrt(z_linked.area) + math.sqrt(z2_linked.area)) / 2
             else:
-                if not t.calculate_width(z_linked, self.zones[t.output[1]] if len(t.output) > 1 else None):
-                    incorrect_transits.append((t, z_linked))
+                to_calculate.append(t)
+
+        # Вершины всех проемов проверяются на вхождение в зоны одним пакетным вызовом
+        corners_inside = self.geometry.transit_corners_inside(
+            to_calculate, [self.zones[t.output[0]] for t in to_calculate]
+        )
+
+        incorrect_transits: List[Tuple[Transit, Zone]] = []
+        for t, inside in zip(to_calculate, corners_inside):
+            z_linked = self.zones[t.output[0]]
+            if not t.calculate_width(
+                z_linked, self.zones[t.output[1]] if len(t.output) > 1 else None, self.geometry, inside
+            ):
+                incorrect_transits.append((t, z_linked))
 
         if len(incorrect_transits) > 0:
             import inspect
@@ -73,6 +115,40 @@ class Bim:
         self._init_safety_zone()
         self.zones[self.safety_zone.id] = self.safety_zone
 
+        self._index_elements()
+
+    def _index_elements(self) -> None:
+        """
+        Плотная нумерация зон и проемов и списки смежности в формате CSR
+
+        Номера совпадают с порядком `zones` и `transits` (безопасная зона -- последняя).
+        UUID остаются внешними идентификаторами для отчетов и выражений QGIS:
+        `zone_ids[i]` и `transit_ids[i]` -- UUID элемента с номером `i`.
+        """
+        self.zone_list: List[Zone] = list(self.zones.values())
+        self.transit_list: List[Transit] = list(self.transits.values())
+        self.zone_ids: List[UUID] = [z.id for z in self.zone_list]
+        self.transit_ids: List[UUID] = [t.id for t in self.transit_list]
+        self.zone_index: Dict[UUID, int] = {zid: i for i, zid in enumerate(self.zone_ids)}
+        self.transit_index: Dict[UUID, int] = {tid: i for i, tid in enumerate(self.transit_ids)}
+
+        for i, z in enumerate(self.zone_list):
+            z.index = i
+        for i, t in enumerate(self.transit_list):
+            t.index = i
+
+        self.transit_zones = Adjacency.from_lists(
+            [[self.zone_index[zid] for zid in t.output] for t in self.transit_list]
+        )
+        self.zone_transits = Adjacency.from_lists(
+            [[self.transit_index[tid] for tid in z.output] for z in self.zone_list]
+        )
+
+    @property
+    def transit_blocked(self) -> npt.NDArray[np.bool_]:
+        """Признаки блокировки проемов в порядке `transit_list`"""
+        return np.array([t.is_blocked for t in self.transit_list], dtype=np.bool_)
+
     @property
     def num_of_people(self) -> float:
         return self._num_of_people
@@ -81,6 +157,11 @@ class Bim:
     def area(self) -> float:
         return self._area
 
+    @property
+    def topology_version(self) -> int:
+        """Номер версии топологии, меняется при изменении ширины или блокировки любого проема"""
+        return self._topology_version.value
+
     @property
     def safety_zone(self) -> "Zone":
         return self._safety_zone
@@ -110,6 +191,45 @@ class Bim:
             z.density = value
 
 
+class Adjacency(NamedTuple):
+    """
+    Список смежности в формате CSR
+
+    Соседи элемента `i` -- `indices[offsets[i] : offsets[i + 1]]` в исходном порядке.
+    """
+
+    offsets: npt.NDArray[np.int64]
+    indices: npt.NDArray[np.int64]
+
+    @staticmethod
+    def from_lists(lists: List[List[int]]) -> "Adjacency":
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(x) for x in lists], out=offsets[1:])
+        indices = np.array([i for x in lists for i in x], dtype=np.int64)
+        return Adjacency(offsets, indices)
+
+    def __call__(self, i: int) -> npt.NDArray[np.int64]:
+        return self.indices[self.offsets[i] : self.offsets[i + 1]]
+
+    def degree(self) -> npt.NDArray[np.int64]:
+        return np.diff(self.offsets)
+
+
+class TopologyVersion:
+    """
+    Счетчик изменений топологии здания
+
+    Общий для всех проемов здания. Увеличивается при изменении ширины или блокировки проема,
+    что позволяет движкам моделирования сбрасывать закешированные данные об обходе графа.
+    """
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def bump(self) -> None:
+        self.value += 1
+
+
 class TransitWidthError(ValueError):
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
@@ -138,6 +258,118 @@ class TransitEdges:
     normal: Tuple[BLine2D, BLine2D]
 
 
+class ElementGeometry:
+    """Геометрия полигона элемента, вычисляемая один раз"""
+
+    def __init__(
+        self,
+        element: BBuildElement,
+        tri: Triangles,
+        bbox: Tuple[float, float, float, float],
+        area: Union[float, None] = None,
+    ) -> None:
+        self.element = element
+        self.tri = tri
+        self.bbox = bbox  # min_x, min_y, max_x, max_y
+        self.area = area  # сумма площадей треугольников без округления
+        self._edges: Union[List[BLine2D], None] = None
+
+    @property
+    def edges(self) -> List[BLine2D]:
+        """Ребра полигона, включая ребро из последней точки в первую"""
+        if self._edges is None:
+            points = self.element.points
+            self._edges = [BLine2D(p0, p1) for p0, p1 in zip(points, points[1:] + points[:1])]
+        return self._edges
+
+
+class GeometryCache:
+    """
+    Кеш геометрии элементов здания по их идентификатору
+
+    Триангуляция, описывающий прямоугольник и ребра полигона вычисляются при первом обращении
+    и используются повторно при вычислении площадей зон и ширин всех проемов, примыкающих к зоне.
+    """
+
+    def __init__(self) -> None:
+        self._items: Dict[UUID, ElementGeometry] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, element_id: UUID) -> bool:
+        return element_id in self._items
+
+    def get(self, element: BBuildElement, tri: Union[Triangles, None] = None) -> ElementGeometry:
+        """
+        Геометрия элемента
+
+        Parameters
+        ----------
+        element : BBuildElement
+            элемент здания
+        tri : Triangles, optional
+            готовая триангуляция полигона, используется вместо `tripy.earclip`, если элемента нет в кеше
+        """
+        geometry = self._items.get(element.id)
+        if geometry is None:
+            points = [(p.x, p.y) for p in element.points[:-1]]
+            xs = [p[0] for p in points] or [0.0]
+            ys = [p[1] for p in points] or [0.0]
+            geometry = ElementGeometry(
+                element,
+                tri if tri is not None else tripy.earclip(points),
+                (min(xs), min(ys), max(xs), max(ys)),
+            )
+            self._items[element.id] = geometry
+        return geometry
+
+    def prepare(self, elements: List[BBuildElement], triangulations: Union[Dict[UUID, Triangles], None] = None) -> None:
+        """Пакетно вычислить триангуляции, описывающие прямоугольники и площади элементов"""
+        new_elements = [e for e in elements if e.id not in self._items]
+        if len(new_elements) == 0:
+            return
+
+        polygons = [[(p.x, p.y) for p in e.points[:-1]] for e in new_elements]
+        tris: List[Triangles] = [
+            triangulations[e.id] if triangulations is not None and e.id in triangulations else tripy.earclip(polygon)
+            for e, polygon in zip(new_elements, polygons)
+        ]
+
+        coords, offsets = BimGeometry.pack_polygons(polygons)
+        bboxes = BimGeometry.bounding_boxes(coords, offsets)
+        areas = BimGeometry.triangulation_areas(*BimGeometry.pack_triangulations(tris)).tolist()
+
+        for e, tri, bbox, area in zip(new_elements, tris, bboxes, areas):
+            self._items[e.id] = ElementGeometry(e, tri, bbox, area)
+
+    def transit_corners_inside(self, transits: List["Transit"], zones: List[BBuildElement]) -> List[List[bool]]:
+        """
+        Пакетная проверка вхождения вершин проемов в зоны
+
+        Для каждой пары (transits[k], zones[k]) возвращает признаки вхождения вершин проема
+        (без замыкающей точки) в полигон зоны, так же как `Transit._point_in_polygon`.
+        """
+        self.prepare(zones)
+
+        zone_index: Dict[UUID, int] = {}
+        zone_tris: List[Triangles] = []
+        for z in zones:
+            if z.id not in zone_index:
+                zone_index[z.id] = len(zone_tris)
+                zone_tris.append(self._items[z.id].tri)
+
+        corners = [[(p.x, p.y) for p in t.points[:-1]] for t in transits]
+        points, point_offsets = BimGeometry.pack_polygons(corners)
+        owners = np.repeat(np.array([zone_index[z.id] for z in zones], dtype=np.int64), np.diff(point_offsets))
+
+        inside = BimGeometry.points_in_triangulations(
+            points, owners, *BimGeometry.pack_triangulations(zone_tris)
+        ).tolist()
+        bounds = point_offsets.tolist()
+        return [inside[bounds[k] : bounds[k + 1]] for k in range(len(transits))]
+
+
 class Transit(BBuildElement):
     MIN_WIDTH = 0.5
 
@@ -151,10 +383,12 @@ class Transit(BBuildElement):
             build_element.sizeZ,
         )
 
+        self.topology_version = TopologyVersion()
+        self.index = -1  # номер в `Bim.transit_list`
         self.potential = 0.0
         self.num_of_people = 0.0
         self.is_visited = False
-        self.is_blocked = False
+        self._is_blocked = False
         self.is_safe = True
 
     @property
@@ -166,13 +400,33 @@ class Transit(BBuildElement):
         if w <= self.MIN_WIDTH:
             raise TransitWidthError(f"Width of transit below or equal {self.MIN_WIDTH} is not possible")
         self._width = w
+        self.topology_version.bump()
 
-    def calculate_width(self, zone_element1: BBuildElement, zone_element2: Union[BBuildElement, None]) -> bool:
-        tr_edges: Union[TransitEdges, None] = self.prepare_transit(zone_element1)
+    @property
+    def is_blocked(self) -> bool:
+        return self._is_blocked
+
+    @is_blocked.setter
+    def is_blocked(self, value: bool) -> None:
+        if value != self._is_blocked:
+            self._is_blocked = value
+            self.topology_version.bump()
+
+    def calculate_width(
+        self,
+        zone_element1: BBuildElement,
+        zone_element2: Union[BBuildElement, None],
+        geometry: Union[GeometryCache, None] = None,
+        corners_inside: Union[List[bool], None] = None,
+    ) -> bool:
+        if geometry is None:
+            geometry = GeometryCache()
+
+        tr_edges: Union[TransitEdges, None] = self.prepare_transit(zone_element1, geometry, corners_inside)
         if tr_edges is not None:
             if self.sign is BSign.DoorWay:
                 if zone_element2 is not None:
-                    self._width = self._door_way_width(zone_element1, zone_element2)
+                    self._width = self._door_way_width(zone_element1, zone_element2, tr_edges, geometry)
                 else:
                     return False
             else:
@@ -180,7 +434,12 @@ class Transit(BBuildElement):
             return True
         return False
 
-    def prepare_transit(self, zone_element: BBuildElement) -> Union[TransitEdges, None]:
+    def prepare_transit(
+        self,
+        zone_element: BBuildElement,
+        geometry: Union[GeometryCache, None] = None,
+        corners_inside: Union[List[bool], None] = None,
+    ) -> Union[TransitEdges, None]:
         """Сортировка ребер проема на параллельные и перпендикулярные стенам комнат
 
         ```
@@ -200,16 +459,26 @@ class Transit(BBuildElement):
         Параллельные ребера для вычсиления ширины двери
 
         Перепендикулярные ребра используются для вычисления ширины виртуального проема
+
+        `corners_inside` -- заранее вычисленные признаки вхождения вершин проема в зону
+        (см. `GeometryCache.transit_corners_inside`)
         """
 
         def _repack_points(points: List[BPoint]) -> List[Point2D]:
             return list(map(lambda p: (p.x, p.y), points[:-1]))
 
         transit_points = _repack_points(self.points)
-        zone_points = _repack_points(zone_element.points)
-        zone_tri: Triangles = tripy.earclip(zone_points)
-
-        edge_points = [i for i, p in enumerate(transit_points) if self._point_in_polygon(p, zone_tri)]
+        if corners_inside is not None:
+            edge_points = [i for i, inside in enumerate(corners_inside) if inside]
+        else:
+            zone_geometry = (geometry if geometry is not None else GeometryCache()).get(zone_element)
+            zone_tri: Triangles = zone_geometry.tri
+            min_x, min_y, max_x, max_y = zone_geometry.bbox
+            edge_points = [
+                i
+                for i, p in enumerate(transit_points)
+                if min_x <= p[0] <= max_x and min_y <= p[1] <= max_y and self._point_in_polygon(p, zone_tri)
+            ]
         edge_points.sort(reverse=True)
 
         if not (len(edge_points) == 2):
@@ -276,7 +545,13 @@ class Transit(BBuildElement):
 
         return True
 
-    def _door_way_width(self, zone_element1: BBuildElement, zone_element2: BBuildElement) -> float:
+    def _door_way_width(
+        self,
+        zone_element1: BBuildElement,
+        zone_element2: BBuildElement,
+        tr_edges: Union[TransitEdges, None] = None,
+        geometry: Union[GeometryCache, None] = None,
+    ) -> float:
         """
         Возможные варианты стыковки помещений, которые соединены проемом
         Код ниже определяет область их пересечения
@@ -299,7 +574,10 @@ class Transit(BBuildElement):
         1. Определить грани помещения, которые пересекает короткая сторона проема
         2. Вычислить среднее проекций граней друг на друга
         """
-        tr_edges: Union[TransitEdges, None] = self.prepare_transit(zone_element1)
+        if geometry is None:
+            geometry = GeometryCache()
+        if tr_edges is None:
+            tr_edges = self.prepare_transit(zone_element1, geometry)
         if tr_edges is None:
             return False
 
@@ -322,21 +600,11 @@ class Transit(BBuildElement):
                 and area_of_triangle(l2.p0, l2.p1, l1.p0) * area_of_triangle(l2.p0, l2.p1, l1.p1) <= 0
             )
 
-        def intersected_edge(
-            polygon: List[BPoint], tline: BLine2D
-        ) -> BLine2D:  # pyright: ignore [reportUnusedFunction]
+        def intersected_edge(edges: List[BLine2D], tline: BLine2D) -> BLine2D:  # pyright: ignore [reportUnusedFunction]
             """ """
-            lines: List[Union[BLine2D, None]] = list(
-                filter(
-                    lambda edge: edge is not None,
-                    map(
-                        lambda p: BLine2D(p[0], p[1]) if is_intersect_line(tline, BLine2D(p[0], p[1])) else None,
-                        zip(polygon, polygon[1:] + polygon[:1]),
-                    ),
-                )
-            )
+            lines: List[BLine2D] = [edge for edge in edges if is_intersect_line(tline, edge)]
 
-            if len(lines) > 1 or lines[0] is None:
+            if len(lines) != 1:
                 raise ValueError("Ошибка геометрии. Проверьте правильность ввода дверей и вирутальных проемов.")
 
             return lines[0]
@@ -376,8 +644,8 @@ class Transit(BBuildElement):
 
             return BPoint(xx, yy)  # pyright: ignore [reportGeneralTypeIssues]
 
-        zone_edge1 = intersected_edge(zone_element1.points, tr_edges.normal[0])
-        zone_edge2 = intersected_edge(zone_element2.points, tr_edges.normal[1])
+        zone_edge1 = intersected_edge(geometry.get(zone_element1).edges, tr_edges.normal[0])
+        zone_edge2 = intersected_edge(geometry.get(zone_element2).edges, tr_edges.normal[1])
 
         projection_line_1to2 = BLine2D(
             nearest_point(zone_edge1.p0, zone_edge2), nearest_point(zone_edge1.p1, zone_edge2)
@@ -393,7 +661,12 @@ class Transit(BBuildElement):
 
 
 class Zone(BBuildElement):
-    def __init__(self, build_element: BBuildElement) -> None:
+    def __init__(
+        self,
+        build_element: BBuildElement,
+        tri: Union[Triangles, None] = None,
+        geometry: Union[GeometryCache, None] = None,
+    ) -> None:
         super().__init__(
             build_element.id,
             build_element.sign,
@@ -403,8 +676,10 @@ class Zone(BBuildElement):
             build_element.sizeZ,
         )
 
-        self._calculate_area()
+        self._calculate_area(tri, geometry)
 
+        self.index = -1  # номер в `Bim.zone_list`
+        self._hash = hash(self.id)
         self.potential = 0.0
         self.num_of_people = 0.0
         self.is_visited = False
@@ -417,11 +692,18 @@ class Zone(BBuildElement):
     def area(self) -> float:
         return self._area
 
-    def _calculate_area(self):
+    def _calculate_area(self, tri: Union[Triangles, None] = None, geometry: Union[GeometryCache, None] = None):
         def triangle_area(p1: Point2D, p2: Point2D, p3: Point2D) -> float:
             return abs(0.5 * ((p2[0] - p1[0]) * (p3[1] - p1[1]) - (p3[0] - p1[0]) * (p2[1] - p1[1])))
 
-        self._tri: Triangles = tripy.earclip([(p.x, p.y) for p in self.points[:-1]])
+        if geometry is not None:
+            element_geometry = geometry.get(self, tri)
+            self._tri: Triangles = element_geometry.tri
+            if element_geometry.area is not None:
+                self._area = round(element_geometry.area, NDIGITS)
+                return
+        else:
+            self._tri = tri if tri is not None else tripy.earclip([(p.x, p.y) for p in self.points[:-1]])
         self._area = round(sum(triangle_area(tr[0], tr[1], tr[2]) for tr in self._tri), NDIGITS)
 
     @property
@@ -450,7 +732,7 @@ class Zone(BBuildElement):
         return f"Zone(name:{self.name})"
 
     def __hash__(self):
-        return hash(self.id)
+        return self._hash
 
 
 # Tests
@@ -3,8 +3,9 @@ import math
 import pytest
 import tripy
 from BimDataModel import BBuildElement, BPoint, BSign
-from BimTools import Zone, BLine2D, Transit
-from typing import Tuple
+from BimTools import Bim, GeometryCache, Zone, BLine2D, Transit
+from BimDataModel import mapping_building
+from typing import List, Tuple
 
 
 class TestBimToolsBLine2D:
@@ -365,3 +366,65 @@ class TestBimToolsZone:
         zone_triangle = Zone(build_element)
 
         assert zone_triangle.area == 15.445482030030712
+
+
+class TestBimToolsGeometryCache:
+    def test_zone_triangulated_once(self, monkeypatch: pytest.MonkeyPatch):
+        calls: List[int] = []
+        earclip = tripy.earclip
+
+        def counting_earclip(polygon: List[Tuple[float, float]]):
+            calls.append(len(polygon))
+            return earclip(polygon)
+
+        monkeypatch.setattr(tripy, "earclip", counting_earclip)
+        bim = Bim(mapping_building("resources/udsu_block_3.json"))
+
+        # Каждая зона, включая безопасную, треангулируется один раз;
+        # безопасная зона строится вне кеша геометрии
+        assert len(calls) == len(bim.zones)
+        assert len(bim.geometry) == len(bim.zones) - 1
+
+    def test_precomputed_triangulation(self):
+        build_element = BBuildElement(
+            id=UUID("00000000-0000-0000-0000-000000000000"),
+            sign=BSign.Room,
+            output=[],
+            points=[
+                BPoint(x=0.0, y=0.0),  # pyright: ignore [reportGeneralTypeIssues]
+                BPoint(x=2.0, y=0.0),  # pyright: ignore [reportGeneralTypeIssues]
+                BPoint(x=2.0, y=2.0),  # pyright: ignore [reportGeneralTypeIssues]
+                BPoint(x=0.0, y=2.0),  # pyright: ignore [reportGeneralTypeIssues]
+                BPoint(x=0.0, y=0.0),  # pyright: ignore [reportGeneralTypeIssues]
+            ],
+            name="room for geometry test",
+            sizeZ=3.0,
+        )
+        tri = [((0.0, 0.0), (2.0, 0.0), (2.0, 2.0)), ((0.0, 0.0), (2.0, 2.0), (0.0, 2.0))]
+
+        geometry = GeometryCache()
+        zone = Zone(build_element, tri, geometry)
+
+        assert zone.area == 4.0
+        assert geometry.get(build_element).tri is tri
+        assert geometry.get(build_element).bbox == (0.0, 0.0, 2.0, 2.0)
+        assert len(geometry.get(build_element).edges) == 5
+
+
+class TestBimToolsBim:
+    def test_dense_indices(self):
+        bim = Bim(mapping_building("resources/two_levels.json"))
+
+        assert [z.index for z in bim.zone_list] == list(range(len(bim.zones)))
+        assert [t.index for t in bim.transit_list] == list(range(len(bim.transits)))
+        assert bim.zone_ids == list(bim.zones)
+        assert bim.safety_zone.index == len(bim.zones) - 1
+
+    def test_adjacency(self):
+        bim = Bim(mapping_building("resources/two_levels.json"))
+
+        for t in bim.transit_list:
+            assert [bim.zone_ids[i] for i in bim.transit_zones(t.index)] == t.output
+        for z in bim.zone_list:
+            assert [bim.transit_ids[i] for i in bim.zone_transits(z.index)] == z.output
+        assert bim.zone_transits.degree().sum() == len(bim.zone_transits.indices)